@@ -26,11 +26,19 @@ import os
 import sys
 import re
 import csv
+import multiprocessing
+import concurrent.futures
 import console
 from collections import defaultdict
 
 
 CSV_HEADER = ['n', 'nome', 'MV', 'MAC', 'IP']
+INDEXED_FIELDS = ['name', 'vm']  # host fields kept in the trigram index
+TRIGRAM_PAD = '\0'
+CLASS_ESCAPES = 'dDwWsSbBAZ'  # regular expression escapes that take no arguments
+FUZZY_DISTANCE = 1  # typos tolerated by `search ... fuzzy`
+PARALLEL_THRESHOLD = 20000  # below this many hosts, searching shards in worker processes isn't worth it
+LEASES_PATH = '/var/lib/dhcp/dhcpd.leases'
 
 
 class Host(object):
@@ -73,47 +81,444 @@ class Host(object):
         return "<Host n='{}' name='{}' vm='{}' mac='{}' ip='{}'>".format(self.n, self.name, self.vm, self.mac, self.ip)
 
 
+def trigrams(string):
+    """Returns the set of lowercase trigrams of the given string."""
+    string = string.lower()
+    return {string[i:i+3] for i in range(len(string) - 2)}
+
+
+def padded_trigrams(string):
+    """Returns the trigrams of the given string, padded so that its beginning and end are also indexed."""
+    return trigrams(TRIGRAM_PAD * 2 + string + TRIGRAM_PAD)
+
+
+def literal_runs(pattern):
+    """
+    Returns the literal substrings that every match of the given regular
+    expression must contain, or None if the pattern is too complex to tell.
+    """
+    if '|' in pattern or '(' in pattern or not pattern.isascii():
+        return None
+    runs = []
+    run = ''
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            escaped = pattern[i+1:i+2]
+            if not escaped.isalnum():
+                run += escaped
+            elif escaped in CLASS_ESCAPES:
+                runs.append(run)
+                run = ''
+            else:
+                # escapes such as \x41, \101 or \u0041 take arguments
+                return None
+            i += 2
+            continue
+        if char in '*?{':
+            # the preceding character becomes optional
+            runs.append(run[:-1])
+            run = ''
+            if char == '{':
+                i = pattern.find('}', i)
+                if i == -1:
+                    return None
+        elif char == '[':
+            runs.append(run)
+            run = ''
+            i += 2 if pattern[i+1:i+2] == '^' else 1
+            if pattern[i:i+1] == ']':
+                i += 1  # a leading ']' belongs to the set
+            while i < len(pattern) and pattern[i] != ']':
+                i += 2 if pattern[i] == '\\' else 1
+            if i >= len(pattern):
+                return None
+        elif char == '+':
+            # the preceding character may repeat, so a new run starts with it
+            runs.append(run)
+            run = run[-1:]
+        elif char in '.^$':
+            runs.append(run)
+            run = ''
+        else:
+            run += char
+        i += 1
+    runs.append(run)
+    return runs
+
+
+def edit_distance(a, b, max_distance):
+    """
+    Returns the Levenshtein distance between a and b, or max_distance + 1
+    as soon as it is known to be greater than max_distance.
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j-1] + 1,
+                previous[j-1] + (char_a != char_b)
+            ))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
 class HostsHandler(object):
     def __init__(self):
         self.hosts = []
+        self._keys = {}  # id(host) -> insertion key, keeps search results in registry order
+        self._by_key = {}
+        self._next_key = 0
+        self._index = {field: defaultdict(set) for field in INDEXED_FIELDS}  # field -> trigram -> keys
+        # re.IGNORECASE folds some non-ASCII characters (e.g. 'ı', 'ſ', 'İ') differently from str.lower(),
+        # so hosts with non-ASCII values are always checked against the regex instead
+        self._non_ascii = {field: set() for field in INDEXED_FIELDS}
+
+    def insert(self, host):
+        self.hosts.append(host)
+        key = self._next_key
+        self._next_key += 1
+        self._keys[id(host)] = key
+        self._by_key[key] = host
+        self._index_host(host, key)
+
+    def __contains__(self, host):
+        return id(host) in self._keys
+
+    def edit(self, host, field, value):
+        key = self._keys[id(host)]
+        self._unindex_host(host, key)
+        setattr(host, field, value)
+        self._index_host(host, key)
+
+    def _index_host(self, host, key):
+        for field in INDEXED_FIELDS:
+            if not getattr(host, field).isascii():
+                self._non_ascii[field].add(key)
+            for trigram in padded_trigrams(getattr(host, field)):
+                self._index[field][trigram].add(key)
+
+    def _unindex_host(self, host, key):
+        for field in INDEXED_FIELDS:
+            self._non_ascii[field].discard(key)
+            index = self._index[field]
+            for trigram in padded_trigrams(getattr(host, field)):
+                index[trigram].discard(key)
+                if not index[trigram]:
+                    del index[trigram]
 
-    def search(self, n='', name='', vm='', mac='', ip=''):
-        re_n = re.compile(n, flags=re.IGNORECASE)
-        re_name = re.compile(name, flags=re.IGNORECASE)
-        re_vm = re.compile(vm, flags=re.IGNORECASE)
-        re_mac = re.compile(mac, flags=re.IGNORECASE)
-        re_ip = re.compile(ip, flags=re.IGNORECASE)
-        found = []
-        for host in self.hosts:
-            if n != '':
-                if re_n.search(host.n) is not None:
-                    if host not in found:
-                        found.append(host)
-            if name != '':
-                if re_name.search(host.name) is not None:
-                    if host not in found:
-                        found.append(host)
-            if vm != '':
-                if re_vm.search(host.vm) is not None:
-                    if host not in found:
-                        found.append(host)
-            if mac != '':
-                if re_mac.search(host.mac) is not None:
-                    if host not in found:
-                        found.append(host)
-            if ip != '':
-                if re_ip.search(host.ip) is not None:
-                    if host not in found:
-                        found.append(host)
+    @staticmethod
+    def _needed_trigrams(pattern):
+        """Returns the trigrams every match of pattern contains, or None if there are none to look up."""
+        runs = literal_runs(pattern)
+        if runs is None:
+            return None
+        needed = set()
+        for run in runs:
+            needed |= trigrams(run)
+        return needed or None
+
+    @staticmethod
+    def needs_scan(n='', name='', vm='', mac='', ip='', fuzzy=0):
+        """Tells whether searching for the given fields goes through every host instead of the index."""
+        if n != '' or mac != '' or ip != '':
+            return True
+        for pattern in [name, vm]:
+            if pattern == '':
+                continue
+            if fuzzy > 0:
+                if len(padded_trigrams(pattern.lower())) - 3 * fuzzy <= 0:
+                    return True
+            elif HostsHandler._needed_trigrams(pattern) is None:
+                return True
+        return False
+
+    def _candidates(self, field, pattern):
+        """
+        Returns the keys of the hosts that might match pattern on the given
+        indexed field, or None if the index cannot narrow them down.
+        """
+        needed = self._needed_trigrams(pattern)
+        if needed is None:
+            return None
+        postings = sorted((self._index[field].get(trigram, set()) for trigram in needed), key=len)
+        return set.intersection(*postings) | self._non_ascii[field]
+
+    def search(self, n='', name='', vm='', mac='', ip='', fuzzy=0):
+        """
+        Looks for hosts that match any of the given fields: each field is a
+        case-insensitive regular expression.
+        If fuzzy is greater than zero, name and vm are instead matched as whole
+        values allowing up to `fuzzy` typos.
+        """
+        return self.by_keys(self.search_keys(n, name, vm, mac, ip, fuzzy))
+
+    def by_keys(self, keys):
+        return [self._by_key[key] for key in keys]
+
+    def search_keys(self, n='', name='', vm='', mac='', ip='', fuzzy=0):
+        """Same as search, but returns the sorted insertion keys of the hosts found."""
+        found = set()
+        scanned = {}
+        for field, pattern in (('name', name), ('vm', vm)):
+            if pattern == '':
+                continue
+            if fuzzy > 0:
+                found |= self._fuzzy_search(field, pattern, fuzzy)
+                continue
+            candidates = self._candidates(field, pattern)
+            regex = re.compile(pattern, flags=re.IGNORECASE)
+            if candidates is None:
+                scanned[field] = regex
+                continue
+            for key in candidates:
+                if regex.search(getattr(self._by_key[key], field)) is not None:
+                    found.add(key)
+        for field, pattern in (('n', n), ('mac', mac), ('ip', ip)):
+            if pattern != '':
+                scanned[field] = re.compile(pattern, flags=re.IGNORECASE)
+        if scanned:
+            for host in self.hosts:
+                for field, regex in scanned.items():
+                    if regex.search(str(getattr(host, field))) is not None:
+                        found.add(self._keys[id(host)])
+                        break
+        return sorted(found)
+
+    def _fuzzy_search(self, field, value, max_distance):
+        value = value.lower()
+        query = padded_trigrams(value)
+        # every typo can spoil at most three trigrams of the query
+        threshold = len(query) - 3 * max_distance
+        if threshold > 0:
+            # a host sharing `threshold` trigrams must own one of the rarest `len(query) - threshold + 1`
+            postings = sorted((self._index[field].get(trigram, set()) for trigram in query), key=len)
+            candidates = [
+                key for key in set().union(*postings[:len(query) - threshold + 1])
+                if sum(key in posting for posting in postings) >= threshold
+            ]
+        else:
+            candidates = self._by_key.keys()
+        found = set()
+        for key in candidates:
+            if edit_distance(value, getattr(self._by_key[key], field).lower(), max_distance) <= max_distance:
+                found.add(key)
         return found
 
     def remove(self, n='', name='', vm='', mac='', ip=''):
+        self.discard(self.search(n, name, vm, mac, ip))
+
+    def discard(self, hosts):
+        to_remove = set()
+        for host in hosts:
+            key = self._keys.pop(id(host))
+            del self._by_key[key]
+            self._unindex_host(host, key)
+            to_remove.add(id(host))
+        self.hosts = [host for host in self.hosts if id(host) not in to_remove]
+
+
+def normalize_mac(mac):
+    """dhcpd writes MAC addresses in lowercase and without leading zeros (e.g. 0:c:29:a:b:c)."""
+    return ':'.join(part.zfill(2) for part in mac.lower().replace('-', ':').split(':'))
+
+
+def read_leases(f):
+    """
+    Yields (ip, mac, hostname) for every lease in the given dhcpd.leases file,
+    reading one line at a time. mac and hostname are None when not recorded.
+    """
+    ip = None
+    for line in f:
+        line = line.strip()
+        if line.startswith('lease ') and line.endswith('{'):
+            ip = line.split()[1]
+            mac = None
+            hostname = None
+        elif ip is None:
+            continue
+        elif line.startswith('hardware ethernet '):
+            mac = normalize_mac(line[len('hardware ethernet '):].rstrip(';').strip())
+        elif line.startswith('client-hostname '):
+            hostname = line[len('client-hostname '):].rstrip(';').strip().strip('"')
+        elif line == '}':
+            yield ip, mac, hostname
+            ip = None
+
+
+_registry = None  # the ShardedHostsHandler searched by worker processes, inherited when they are forked
+
+
+def _search_shard(name, fields):
+    return name, _registry.shards[name].search_keys(**fields)
+
+
+class ShardedHostsHandler(object):
+    """
+    A registry made of named HostsHandler shards, one for each inventory csv
+    file (e.g. one per class or lab).
+    Large registries are searched in parallel, one shard per worker process.
+    """
+    def __init__(self):
+        self.shards = {}
+        self.paths = {}
+        self._pool = None
+
+    def add_shard(self, name, path):
+        if name in self.shards:
+            raise ValueError("Shard '{}' already exists.".format(name))
+        shard = HostsHandler()
+        self.shards[name] = shard
+        self.paths[name] = path
+        self._invalidate()
+        return shard
+
+    @property
+    def hosts(self):
         hosts = []
-        to_remove = self.search(n, name, vm, mac, ip)
-        for host in self.hosts:
-            if host not in to_remove:
-                hosts.append(host)
-        self.hosts = hosts
+        for shard in self.shards.values():
+            hosts.extend(shard.hosts)
+        return hosts
+
+    def shard_of(self, host):
+        for name, shard in self.shards.items():
+            if host in shard:
+                return name
+        return None
+
+    def insert(self, host, shard):
+        self.shards[shard].insert(host)
+        self._invalidate()
+
+    def edit(self, host, field, value):
+        self.shards[self.shard_of(host)].edit(host, field, value)
+        self._invalidate()
+
+    def search(self, n='', name='', vm='', mac='', ip='', fuzzy=0):
+        fields = {'n': n, 'name': name, 'vm': vm, 'mac': mac, 'ip': ip, 'fuzzy': fuzzy}
+        # searches answered by the trigram index are faster than a round trip to the workers
+        pool = self._get_pool() if HostsHandler.needs_scan(**fields) else None
+        if pool is None:
+            found = {shard: self.shards[shard].search_keys(**fields) for shard in self.shards}
+        else:
+            found = dict(pool.map(_search_shard, self.shards, [fields] * len(self.shards)))
+        hosts = []
+        for shard in self.shards:
+            hosts.extend(self.shards[shard].by_keys(found[shard]))
+        return hosts
+
+    def remove(self, n='', name='', vm='', mac='', ip=''):
+        found = self.search(n, name, vm, mac, ip)
+        for shard in self.shards.values():
+            shard.discard([host for host in found if host in shard])
+        self._invalidate()
+
+    def conflicts(self):
+        """
+        Returns a list of (field, value, [(shard, host), ...]) for every MAC or
+        IP address used by more than one host in the whole registry.
+        """
+        conflicts = []
+        for field in ['mac', 'ip']:
+            owners = defaultdict(list)
+            for name, shard in self.shards.items():
+                for host in shard.hosts:
+                    value = getattr(host, field)
+                    if value != '':
+                        owners[normalize_mac(value) if field == 'mac' else value.lower()].append((name, host))
+            for value, hosts in owners.items():
+                if len(hosts) > 1:
+                    conflicts.append((field, value, hosts))
+        return conflicts
+
+    def address_users(self, mac='', ip=''):
+        """Returns (field, shard, host) for every host using the given MAC or IP address."""
+        if mac != '':
+            mac = normalize_mac(mac)
+        users = []
+        for name, shard in self.shards.items():
+            for host in shard.hosts:
+                if mac != '' and host.mac != '' and normalize_mac(host.mac) == mac:
+                    users.append(('MAC', name, host))
+                if ip != '' and host.ip.lower() == ip.lower():
+                    users.append(('IP', name, host))
+        return users
+
+    def reconcile(self, leases):
+        """
+        Hash-joins (ip, mac, hostname) leases, e.g. from read_leases, against
+        the MAC and IP addresses of the registry. Leases are consumed one at a
+        time, so memory only depends on the registry and on the distinct
+        addresses found, not on the length of the lease history.
+        Returns a tuple (unknown, never_leased, mismatches, count):
+            unknown: (ip, mac, hostname) of the last lease of every MAC
+              address matching no host by either MAC or IP;
+            never_leased: (shard, host) for every host no lease was given to;
+            mismatches: (shard, host, field, value) for every lease given to a
+              host's MAC with another IP, or to a host's IP with another MAC;
+            count: the number of leases read.
+        """
+        by_mac = defaultdict(list)
+        by_ip = defaultdict(list)
+        for name, shard in self.shards.items():
+            for host in shard.hosts:
+                if host.mac != '':
+                    by_mac[normalize_mac(host.mac)].append((name, host))
+                if host.ip != '':
+                    by_ip[host.ip].append((name, host))
+        leased = set()
+        unknown = {}
+        mismatches = {}
+        count = 0
+        for ip, mac, hostname in leases:
+            count += 1
+            owners = by_mac.get(mac, []) if mac is not None else []
+            for name, host in owners:
+                leased.add(id(host))
+                if host.ip != '' and host.ip != ip:
+                    mismatches[(id(host), 'IP', ip)] = (name, host, 'IP', ip)
+            if mac is not None:
+                for name, host in by_ip.get(ip, []):
+                    if host.mac != '' and normalize_mac(host.mac) != mac:
+                        mismatches[(id(host), 'MAC', mac)] = (name, host, 'MAC', mac)
+            if mac is not None and not owners and ip not in by_ip:
+                unknown[mac] = (ip, mac, hostname)
+        never_leased = [
+            (name, host) for name, shard in self.shards.items() for host in shard.hosts if id(host) not in leased
+        ]
+        return list(unknown.values()), never_leased, list(mismatches.values()), count
+
+    def _get_pool(self):
+        global _registry
+        if len(self.shards) < 2 or (os.cpu_count() or 1) < 2:
+            return None
+        if sum(len(shard.hosts) for shard in self.shards.values()) < PARALLEL_THRESHOLD:
+            return None
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            return None
+        if self._pool is None:
+            # workers get a copy of the registry as it is now: any change to it must discard the pool
+            _registry = self
+            self._pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=min(os.cpu_count() or 1, len(self.shards)),
+                mp_context=multiprocessing.get_context('fork')
+            )
+        return self._pool
+
+    def _invalidate(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+    def close(self):
+        self._invalidate()
 
 
 class MainConsole(console.Console):
@@ -130,9 +535,12 @@ class MainConsole(console.Console):
             ExportCommand(),
             RemoveCommand(),
             EditCommand(),
+            ConflictsCommand(),
+            ReconcileCommand(),
         ]
 
     def closing(self):
+        self.hosts_handler.close()
         print('\n\n\nDo you wish to save before closing?\n')
         SaveCommand().run(['closing'], None, self)
 
@@ -185,25 +593,43 @@ You can look at command-specific help by typing "help [command]". Have Fun!
 class InsertCommand(console.Command):
     def __init__(self):
         super().__init__(
-            recognition="insert",
-            help_str="Insert a new host in the list.",
-            usage_str="Usage:      - insert: Insert a new host in the list.",
+            recognition="insert $",
+            help_str="Insert a new host in the list.\nWhen several inventories are loaded, the host is "
+                     "inserted in the given shard.",
+            usage_str="Usage:      - insert: Insert a new host in the list.\n"
+                      "            - insert [shard]: Insert a new host in the given shard.",
             short_name="insert",
             short_help="Insert a new host in the list."
         )
 
     def run(self, args, usr, con=None):
+        shards = con.hosts_handler.shards
         fields = {}
         print("Press Ctrl-C to cancel at any moment.")
+        if args:
+            shard = args[0]
+        elif len(shards) == 1:
+            shard = next(iter(shards))
+        else:
+            try:
+                shard = input("Please insert the shard to insert into [{}]: ".format(', '.join(shards)))
+            except KeyboardInterrupt:
+                print('')
+                return
+        if shard not in shards:
+            print("Cannot find shard '{}'.".format(shard))
+            return
         for field in CSV_HEADER[1:]:  # excludes field 'n' which can be automatically generated
             try:
                 fields[field] = input("Please insert data for the '{}' field: ".format(field))
             except KeyboardInterrupt:
                 print('')
                 return
-        con.hosts_handler.hosts.append(
-            Host(n=len(con.hosts_handler.hosts)+1, name=fields['nome'], vm=fields['MV'], mac=fields['MAC'],
-                 ip=fields['IP'])
+        warn_address_users(con.hosts_handler, mac=fields['MAC'], ip=fields['IP'])
+        con.hosts_handler.insert(
+            Host(n=str(len(shards[shard].hosts)+1), name=fields['nome'], vm=fields['MV'], mac=fields['MAC'],
+                 ip=fields['IP']),
+            shard
         )
         print("New host correctly added.")
 
@@ -211,11 +637,15 @@ class InsertCommand(console.Command):
 class SearchCommand(console.Command):
     def __init__(self):
         super().__init__(
-            recognition="search % $ $ $ $",
-            usage_str="Usage:      - search [field1[field2[...]]]: search for hosts in registry.",
+            recognition="search % $ $ $ $ $",
+            usage_str="Usage:      - search [field1[field2[...]]]: search for hosts in registry.\n"
+                      "            - search [field1[field2[...]]] fuzzy: search for hosts in registry, "
+                      "tolerating typos in fields 'nome' and 'MV'.",
             short_name="search",
             help_str="Search for hosts using given arguments: each argument represents a field."
-                     "\nEach field must be one of 'n', 'nome', 'MV', 'MAC' or 'IP'.",
+                     "\nEach field must be one of 'n', 'nome', 'MV', 'MAC' or 'IP'."
+                     "\nWith 'fuzzy', 'nome' and 'MV' must match the whole value with at most {} "
+                     "typo{}.".format(FUZZY_DISTANCE, '' if FUZZY_DISTANCE == 1 else 's'),
             short_help="Search for hosts in registry."
         )
 
@@ -226,6 +656,8 @@ class SearchCommand(console.Command):
         fields = defaultdict(str)
         print("Press Ctrl-C to cancel at any moment.")
         for arg in args:
+            if arg == 'fuzzy':
+                continue
             if arg not in field_names:
                 print("Argument '{}' is not a valid field name.".format(arg))
                 continue
@@ -237,13 +669,17 @@ class SearchCommand(console.Command):
                     return
                 fields[arg] = inp
         found = con.hosts_handler.search(
-            n=fields['n'], name=fields['nome'], vm=fields['mv'], mac=fields['mac'], ip=fields['ip']
+            n=fields['n'], name=fields['nome'], vm=fields['mv'], mac=fields['mac'], ip=fields['ip'],
+            fuzzy=FUZZY_DISTANCE if 'fuzzy' in args else 0
         )
         if len(found) == 0:
             print("No hosts found.")
         else:
             for host in found:
-                print(" - {}".format(host))
+                if len(con.hosts_handler.shards) > 1:
+                    print(" - [{}] {}".format(con.hosts_handler.shard_of(host), host))
+                else:
+                    print(" - {}".format(host))
             print("Found {} host{}.".format(len(found), '' if len(found) == 1 else 's'))
 
 
@@ -308,9 +744,10 @@ class EditCommand(console.Command):
                         continue
                     else:
                         changed = True
-                        setattr(host, field, inp)
+                        if field in ['mac', 'ip']:
+                            warn_address_users(con.hosts_handler, exclude=host, **{field: inp})
+                        con.hosts_handler.edit(host, field, inp)
                 if changed:
-                    con.hosts_handler.hosts[con.hosts_handler.hosts.index(host)] = host
                     print("Successfully edited host.")
                 else:
                     print("Host unchanged.")
@@ -400,44 +837,85 @@ class ListCommand(console.Command):
 class SaveCommand(console.Command):
     def __init__(self):
         super().__init__(
-            recognition='save',
-            help_str="Saves current session to csv file.",
-            usage_str="Usage:      - save: saves current session to csv.",
+            recognition='save $',
+            help_str="Saves current session to csv file.\nWhen several inventories are loaded, every shard "
+                     "is saved to its own csv file in the given directory.",
+            usage_str="Usage:      - save: saves current session to csv.\n"
+                      "            - save [shard]: saves only the given shard to csv.",
             short_name="save",
             short_help="Saves current session."
         )
 
     def run(self, args, usr, con=None):
-        print("Press Ctrl-C to {}.".format('cancel' if len(args) == 0 else 'not save'))
-        try:
-            path = input("Saving path [{}]: ".format(con.csv_path))
-        except KeyboardInterrupt:
-            print('\nNothing saved.')
+        handler = con.hosts_handler
+        shards = [arg for arg in args if arg != 'closing']
+        if shards and shards[0] not in handler.shards:
+            print("Cannot find shard '{}'.".format(shards[0]))
             return
-        if path == '':
-            path = con.csv_path
-        else:
-            con.csv_path = path
-        with open(path, 'w') as f:
-            writer = csv.DictWriter(f, fieldnames=CSV_HEADER)
-            writer.writeheader()
-            for host in con.hosts_handler.hosts:
-                writer.writerow(host.to_csv())
+        print("Press Ctrl-C to {}.".format('cancel' if 'closing' not in args else 'not save'))
+        while True:  # ask again when saving fails, so that no changes are lost when closing
+            if shards or len(handler.shards) == 1:
+                shard = shards[0] if shards else next(iter(handler.shards))
+                try:
+                    path = input("Saving path [{}]: ".format(handler.paths[shard]))
+                except (KeyboardInterrupt, EOFError):
+                    print('\nNothing saved.')
+                    return
+                if path == '':
+                    path = handler.paths[shard]
+                try:
+                    write_csv(path, handler.shards[shard].hosts)
+                except OSError:
+                    print("Could not save to '{}'.".format(path))
+                    continue
+                handler.paths[shard] = path
+                if len(handler.shards) == 1:
+                    con.csv_path = path
+            else:
+                try:
+                    path = input("Saving directory [{}]: ".format(con.csv_path))
+                except (KeyboardInterrupt, EOFError):
+                    print('\nNothing saved.')
+                    return
+                if path == '':
+                    path = con.csv_path
+                paths = {}
+                for shard in handler.shards:
+                    paths[shard] = os.path.join(path, os.path.basename(handler.paths[shard]))
+                try:
+                    os.makedirs(path, exist_ok=True)
+                    for shard in handler.shards:
+                        write_csv(paths[shard], handler.shards[shard].hosts)
+                except OSError:
+                    print("Could not save to directory '{}'.".format(path))
+                    continue
+                handler.paths.update(paths)
+                con.csv_path = path
+            break
         print("Successfully saved.")
 
 
 class ExportCommand(console.Command):
     def __init__(self):
         super().__init__(
-            recognition='export $',
+            recognition='export $ $',
             help_str="Exports current session in dhcpd.conf-compatible format to file.",
             usage_str="Usage:      - export: export to path.\n"
-                      "            - export simple: export to path, do not include headers and footers.",
+                      "            - export simple: export to path, do not include headers and footers.\n"
+                      "            - export [shard]: export only the given shard to path.",
             short_name="export",
             short_help="Exports current session."
         )
 
     def run(self, args, usr, con=None):
+        shards = [arg for arg in args if arg != 'simple']
+        if shards:
+            if shards[0] not in con.hosts_handler.shards:
+                print("Cannot find shard '{}'.".format(shards[0]))
+                return
+            hosts = con.hosts_handler.shards[shards[0]].hosts
+        else:
+            hosts = con.hosts_handler.hosts
         print("Press Ctrl-C to cancel.")
         try:
             path = input("Exporting path: ")
@@ -450,7 +928,7 @@ class ExportCommand(console.Command):
                     with open('dhcpdconf-header.txt', 'r') as headerfile:
                         f.write(headerfile.read())
                 except: pass
-            for host in con.hosts_handler.hosts:
+            for host in hosts:
                 f.write(host.to_dhcp())
             if 'simple' not in args:
                 try:
@@ -460,18 +938,95 @@ class ExportCommand(console.Command):
         print("Successfully exported.")
 
 
+class ConflictsCommand(console.Command):
+    def __init__(self):
+        super().__init__(
+            recognition='conflicts',
+            help_str="Shows every MAC or IP address assigned to more than one host, across all shards.",
+            usage_str="Usage:      - conflicts: shows MAC and IP conflicts.",
+            short_name="conflicts",
+            short_help="Shows MAC and IP conflicts."
+        )
+
+    def run(self, args, usr, con=None):
+        conflicts = con.hosts_handler.conflicts()
+        if len(conflicts) == 0:
+            print("No conflicts found.")
+            return
+        for field, value, hosts in conflicts:
+            print("{} '{}' is used by:".format(field.upper(), value))
+            for shard, host in hosts:
+                print(" - [{}] {}".format(shard, host))
+        print("Found {} conflict{}.".format(len(conflicts), '' if len(conflicts) == 1 else 's'))
+
+
+class ReconcileCommand(console.Command):
+    def __init__(self):
+        super().__init__(
+            recognition='reconcile',
+            help_str="Compares the registry with the leases dhcpd actually handed out, as recorded in a "
+                     "dhcpd.leases file.\nShows clients unknown to the registry, hosts that never got a lease "
+                     "and leases whose IP or MAC address differs from the registered one.",
+            usage_str="Usage:      - reconcile: compares the registry with a dhcpd.leases file.",
+            short_name="reconcile",
+            short_help="Compares the registry with dhcpd leases."
+        )
+
+    def run(self, args, usr, con=None):
+        print("Press Ctrl-C to cancel.")
+        try:
+            path = input("Leases path [{}]: ".format(LEASES_PATH))
+        except KeyboardInterrupt:
+            print('')
+            return
+        if path == '':
+            path = LEASES_PATH
+        try:
+            # hostnames are whatever clients sent: don't let a stray byte stop the whole file
+            with open(path, 'r', errors='replace') as f:
+                unknown, never_leased, mismatches, count = con.hosts_handler.reconcile(read_leases(f))
+        except (OSError, ValueError):
+            print("Cannot read file '{}'.".format(path))
+            return
+        print("Read {} lease{}.".format(count, '' if count == 1 else 's'))
+        print("\nUnknown clients ({}):".format(len(unknown)))
+        for ip, mac, hostname in unknown:
+            print(" - mac='{}' ip='{}' hostname='{}'".format(mac, ip, hostname or ''))
+        print("\nHosts that never leased ({}):".format(len(never_leased)))
+        for shard, host in never_leased:
+            print(" - [{}] {}".format(shard, host))
+        print("\nMismatches ({}):".format(len(mismatches)))
+        for shard, host, field, value in mismatches:
+            print(" - [{}] {} leased with {} '{}'".format(shard, host, field, value))
+
+
+def warn_address_users(hosts_handler, mac='', ip='', exclude=None):
+    """Warns about every host, in any shard, already using the given MAC or IP address."""
+    for field, shard, host in hosts_handler.address_users(mac, ip):
+        if host is not exclude:
+            print("Warning: {} '{}' is already used by {} in shard '{}'.".format(
+                field, mac if field == 'MAC' else ip, host, shard
+            ))
+
+
+def write_csv(path, hosts):
+    with open(path, 'w') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_HEADER)
+        writer.writeheader()
+        for host in hosts:
+            writer.writerow(host.to_csv())
 
 
 def main(args):
     csv_path = ''
     if len(args) > 0:
         csv_path = args[0]
-        print("{} file '{}'.".format('Using' if os.path.exists(csv_path) else 'Cannot use', csv_path))
+        print("{} '{}'.".format('Using' if os.path.exists(csv_path) else 'Cannot use', csv_path))
     if not os.path.exists(csv_path):
         first = True
         while True:
             try:
-                csv_path = input("Please, insert{} csv file path [new]: ".format('' if first else ' a valid'))
+                csv_path = input("Please, insert{} csv file or directory path [new]: ".format('' if first else ' a valid'))
             except KeyboardInterrupt:
                 return
             first = False
@@ -481,28 +1036,54 @@ def main(args):
                 except KeyboardInterrupt:
                     return
                 try:
-                    with open(csv_path, 'w') as f:
-                        writer = csv.DictWriter(f, fieldnames=CSV_HEADER)
-                        writer.writeheader()
+                    write_csv(csv_path, [])
                     break
                 except:
                     print("Could not create file.")
             if os.path.exists(csv_path):
                 break
-    hosts_handler = HostsHandler()
-    with open(csv_path, 'r') as f:
-        try:
-            reader = csv.reader(f)
-            for row in reader:
-                if row == CSV_HEADER:
-                    continue
-                hosts_handler.hosts.append(
-                    Host(n=row[0], name=row[1], vm=row[2], mac=row[3], ip=row[4])
-                )
-        except Exception:
-            print("Error while parsing csv file. Quitting.")
-            sys.exit(1)
-    print("Read {} hosts.".format(len(hosts_handler.hosts)))
+    if os.path.isdir(csv_path):
+        paths = sorted(
+            os.path.join(csv_path, name) for name in os.listdir(csv_path)
+            if name.lower().endswith('.csv') and os.path.isfile(os.path.join(csv_path, name))
+        )
+        if len(paths) == 0:
+            print("No csv files found in directory '{}'. Quitting.".format(csv_path))
+            return
+    else:
+        paths = [csv_path]
+    # commands are typed in lowercase, so shard names are too
+    names = {}
+    for path in paths:
+        name = os.path.splitext(os.path.basename(path))[0].lower()
+        if name in names:
+            print("Files '{}' and '{}' would both be loaded as shard '{}'. Quitting.".format(names[name], path, name))
+            return
+        names[name] = path
+    hosts_handler = ShardedHostsHandler()
+    for name, path in names.items():
+        shard = hosts_handler.add_shard(name, path)
+        with open(path, 'r') as f:
+            try:
+                reader = csv.reader(f)
+                for row in reader:
+                    if row == CSV_HEADER:
+                        continue
+                    shard.insert(
+                        Host(n=row[0], name=row[1], vm=row[2], mac=row[3], ip=row[4])
+                    )
+            except Exception:
+                print("Error while parsing csv file '{}'. Quitting.".format(path))
+                sys.exit(1)
+    if len(paths) > 1:
+        print("Read {} hosts from {} shards: {}.".format(
+            len(hosts_handler.hosts), len(paths), ', '.join(hosts_handler.shards)
+        ))
+    else:
+        print("Read {} hosts.".format(len(hosts_handler.hosts)))
+    conflicts = len(hosts_handler.conflicts())
+    if conflicts > 0:
+        print("Found {} MAC/IP conflict{}: type 'conflicts' to list them.".format(conflicts, '' if conflicts == 1 else 's'))
     con = MainConsole(hosts_handler, csv_path)
     con.loop()
 
@@ -0,0 +1,102 @@
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from main import Host, ShardedHostsHandler, normalize_mac, read_leases
+
+
+LEASES = """\
+# The format of this file is documented in the dhcpd.leases(5) manual page.
+# This lease file was written by isc-dhcp-4.3.3
+authoring-byte-order little-endian;
+server-duid "\\000\\001\\000\\001\\036\\325";
+
+lease 10.0.0.1 {
+  starts 4 2016/06/02 10:00:00;
+  ends 4 2016/06/02 22:00:00;
+  binding state active;
+  next binding state free;
+  hardware ethernet 0:c:29:a:b:1;
+  uid "\\001\\000\\014)\\012\\013\\001";
+  set vendor-class-identifier = "MSFT 5.0";
+  client-hostname "ascari";
+}
+lease 10.0.0.50 {
+  binding state active;
+  hardware ethernet 00:0c:29:0a:0b:02;
+}
+lease 10.0.0.3 {
+  binding state active;
+  hardware ethernet 00:0c:29:0a:0b:99;
+}
+lease 10.0.0.4 {
+  binding state free;
+}
+lease 10.9.9.9 {
+  binding state active;
+  hardware ethernet 0:1:2:3:4:5;
+  client-hostname "stranger";
+}
+lease 10.9.9.10 {
+  binding state active;
+  hardware ethernet 0:1:2:3:4:5;
+  client-hostname "stranger";
+}
+lease 10.0.0.6 {
+  binding state active;
+  hardware ethernet 00:0c:29:0a:0b:66;
+}
+lease 10.0.0.77 {
+  binding state active;
+  hardware ethernet 00:0c:29:0a:0b:07;
+}
+"""
+
+
+def make_registry():
+    registry = ShardedHostsHandler()
+    lab1 = registry.add_shard('lab1', 'lab1.csv')
+    lab1.insert(Host(n='1', name='ascari', vm='1', mac='00:0C:29:0A:0B:01', ip='10.0.0.1'))
+    lab1.insert(Host(n='2', name='baraldi', vm='2', mac='00-0C-29-0A-0B-02', ip='10.0.0.2'))
+    lab2 = registry.add_shard('lab2', 'lab2.csv')
+    lab2.insert(Host(n='1', name='bastardi', vm='3', mac='00:0c:29:0a:0b:03', ip='10.0.0.3'))
+    lab2.insert(Host(n='2', name='brugioni', vm='4', mac='00:0c:29:0a:0b:04', ip='10.0.0.4'))
+    lab2.insert(Host(n='3', name='carletti', vm='5', mac='00:0c:29:0a:0b:05', ip='10.0.0.5'))
+    lab2.insert(Host(n='4', name='carone', vm='6', mac='', ip='10.0.0.6'))
+    lab2.insert(Host(n='5', name='chiavacci', vm='7', mac='00:0c:29:0a:0b:07', ip=''))
+    return registry
+
+
+def test_normalize_mac():
+    assert normalize_mac('0:c:29:a:b:1') == '00:0c:29:0a:0b:01'
+    assert normalize_mac('00-0C-29-0A-0B-01') == '00:0c:29:0a:0b:01'
+
+
+def test_read_leases():
+    assert list(read_leases(io.StringIO(LEASES))) == [
+        ('10.0.0.1', '00:0c:29:0a:0b:01', 'ascari'),
+        ('10.0.0.50', '00:0c:29:0a:0b:02', None),
+        ('10.0.0.3', '00:0c:29:0a:0b:99', None),
+        ('10.0.0.4', None, None),
+        ('10.9.9.9', '00:01:02:03:04:05', 'stranger'),
+        ('10.9.9.10', '00:01:02:03:04:05', 'stranger'),
+        ('10.0.0.6', '00:0c:29:0a:0b:66', None),
+        ('10.0.0.77', '00:0c:29:0a:0b:07', None),
+    ]
+
+
+def test_reconcile():
+    unknown, never_leased, mismatches, count = make_registry().reconcile(read_leases(io.StringIO(LEASES)))
+    assert count == 8
+    # one entry per client, with its last lease
+    assert unknown == [('10.9.9.10', '00:01:02:03:04:05', 'stranger')]
+    # carone has no MAC and chiavacci no IP: the leases of their other field are not mismatches
+    assert [(shard, host.name) for shard, host in never_leased] == [
+        ('lab2', 'bastardi'), ('lab2', 'brugioni'), ('lab2', 'carletti'), ('lab2', 'carone')
+    ]
+    assert [(shard, host.name, field, value) for shard, host, field, value in mismatches] == [
+        ('lab1', 'baraldi', 'IP', '10.0.0.50'),
+        ('lab2', 'bastardi', 'MAC', '00:0c:29:0a:0b:99'),
+    ]
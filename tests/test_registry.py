@@ -0,0 +1,117 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import main
+from main import Host, ShardedHostsHandler
+
+
+def make_registry():
+    registry = ShardedHostsHandler()
+    for shard in ['lab1', 'lab2', 'lab3']:
+        handler = registry.add_shard(shard, shard + '.csv')
+        for n in range(1, 21):
+            handler.insert(Host(
+                n=str(n), name='{}host{:02}'.format(shard, n), vm=str(100 + n),
+                mac='00:0c:29:{:02x}:00:{:02x}'.format(int(shard[-1]), n), ip='10.0.{}.{}'.format(shard[-1], n)
+            ))
+    return registry
+
+
+@pytest.fixture
+def pooled(monkeypatch):
+    if 'fork' not in main.multiprocessing.get_all_start_methods():
+        pytest.skip("worker processes need the fork start method")
+    monkeypatch.setattr(main, 'PARALLEL_THRESHOLD', 1)
+    monkeypatch.setattr(main.os, 'cpu_count', lambda: 2)
+
+
+def test_search_merges_shards_in_order():
+    registry = make_registry()
+    found = registry.search(name='host0[12]')
+    assert [(registry.shard_of(host), host.name) for host in found] == [
+        ('lab1', 'lab1host01'), ('lab1', 'lab1host02'),
+        ('lab2', 'lab2host01'), ('lab2', 'lab2host02'),
+        ('lab3', 'lab3host01'), ('lab3', 'lab3host02'),
+    ]
+
+
+def test_remove_across_shards():
+    registry = make_registry()
+    registry.remove(ip=r'\.1$')
+    assert len(registry.hosts) == 57
+    assert registry.search(name='host01') == []
+    assert [host.name for host in registry.search(name='host10')] == ['lab1host10', 'lab2host10', 'lab3host10']
+
+
+def test_pooled_search_equals_in_process(pooled):
+    registry = make_registry()
+    try:
+        for fields in [{'mac': '0[12]$'}, {'ip': r'\.1'}, {'n': '^1$', 'name': 'lab3'}, {'name': 'a|x'}]:
+            found = registry.search(**fields)
+            assert registry._pool is not None
+            with pytest.MonkeyPatch.context() as m:
+                m.setattr(main, 'PARALLEL_THRESHOLD', 10 ** 9)
+                assert found == registry.search(**fields)
+                assert len(found) > 0
+    finally:
+        registry.close()
+
+
+def test_indexed_search_does_not_use_pool(pooled):
+    registry = make_registry()
+    assert len(registry.search(name='lab2host')) == 20
+    assert registry._pool is None
+
+
+def test_changes_discard_stale_pool(pooled):
+    registry = make_registry()
+    try:
+        host = registry.search(ip=r'^10\.0\.1\.1$')[0]
+        registry.edit(host, 'ip', '10.9.9.9')
+        assert registry._pool is None
+        assert registry.search(ip='10.9.9.9') == [host]
+        registry.insert(Host(n='21', name='new', vm='1', mac='', ip='10.8.8.8'), 'lab2')
+        assert registry._pool is None
+        assert [host.name for host in registry.search(ip='10.8.8.8')] == ['new']
+        registry.remove(ip='10.8.8.8')
+        assert registry._pool is None
+        assert registry.search(ip='10.8.8.8') == []
+    finally:
+        registry.close()
+
+
+def test_add_shard_refuses_duplicates():
+    registry = make_registry()
+    with pytest.raises(ValueError):
+        registry.add_shard('lab1', 'other.csv')
+    assert len(registry.shards['lab1'].hosts) == 20
+
+
+def test_conflicts_across_shards():
+    registry = make_registry()
+    assert registry.conflicts() == []
+    ascari = Host(n='21', name='ascari', vm='1', mac='00:0C:29:01:00:01', ip='10.0.3.1')
+    baraldi = Host(n='21', name='baraldi', vm='2', mac='0-c-29-1-0-1', ip='')
+    registry.insert(ascari, 'lab2')
+    registry.insert(baraldi, 'lab3')
+    conflicts = registry.conflicts()
+    assert len(conflicts) == 2
+    [(field, value, owners)] = [conflict for conflict in conflicts if conflict[0] == 'mac']
+    assert value == '00:0c:29:01:00:01'
+    assert [(shard, host.name) for shard, host in owners] == [
+        ('lab1', 'lab1host01'), ('lab2', 'ascari'), ('lab3', 'baraldi')
+    ]
+    [(field, value, owners)] = [conflict for conflict in conflicts if conflict[0] == 'ip']
+    assert [(shard, host.name) for shard, host in owners] == [('lab2', 'ascari'), ('lab3', 'lab3host01')]
+
+
+def test_address_users_normalizes_mac():
+    registry = make_registry()
+    users = registry.address_users(mac='0:C:29:2:0:5', ip='10.0.3.7')
+    assert [(field, shard, host.name) for field, shard, host in users] == [
+        ('MAC', 'lab2', 'lab2host05'), ('IP', 'lab3', 'lab3host07')
+    ]
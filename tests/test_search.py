@@ -0,0 +1,55 @@
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from main import Host, HostsHandler, literal_runs
+
+
+NAMES = ['Abcdef', 'abcdef', ']yzhost', 'xyz', 'xbc', 'ascari', 'baraldi', 'bastardi', 'a.bcd', 'ab\\cd', 'A', 'Yıldız', 'İlker', 'ſtefano', '\u212aelvin']
+
+PATTERNS = [
+    r'\x41bc', r'\101bc', r'Abc', r'\N{LATIN CAPITAL LETTER A}bc',
+    r'[\]x]yz', r'[^\]]yz', r'[]x]yz', r'[a\-c]def',
+    r'abc', r'ABC', r'ab+c', r'ab?cd', r'a.bc', r'a\.bcd', r'\.*', r'ab\\cd',
+    r'yildiz', r'ilker', r'stefano', r'kelvin', r'lvin',
+    r'\dbc', r'\bbas', r'ast\w+', r'^bar', r'ldi$', r'ab{1}c', r'a|xyz', r'(ab)c',
+]
+
+
+def make_handler():
+    handler = HostsHandler()
+    for n, name in enumerate(NAMES, 1):
+        handler.insert(Host(n=str(n), name=name, vm=name, mac='', ip=''))
+    return handler
+
+
+def test_literal_runs_occur_in_every_match():
+    for pattern in PATTERNS:
+        runs = literal_runs(pattern)
+        if runs is None:
+            continue
+        for name in NAMES:
+            if not name.isascii():
+                continue  # checked by test_search_matches_full_scan instead
+            match = re.search(pattern, name, flags=re.IGNORECASE)
+            if match is not None:
+                for run in runs:
+                    assert run.lower() in name.lower(), (pattern, name, run)
+
+
+def test_search_matches_full_scan():
+    handler = make_handler()
+    for pattern in PATTERNS:
+        expected = [host for host in handler.hosts if re.search(pattern, host.name, flags=re.IGNORECASE)]
+        assert handler.search(name=pattern) == expected, pattern
+        assert handler.search(vm=pattern) == expected, pattern
+
+
+def test_remove_matches_full_scan():
+    for pattern in PATTERNS:
+        handler = make_handler()
+        expected = [host for host in handler.hosts if not re.search(pattern, host.name, flags=re.IGNORECASE)]
+        handler.remove(name=pattern)
+        assert handler.hosts == expected, pattern